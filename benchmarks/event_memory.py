@@ -0,0 +1,56 @@
+"""Compares the memory per event of API resources, Event records and the events DataFrame.
+
+Runs offline on synthetic events as returned with the fields mask of the Calendar API:
+    python benchmarks/event_memory.py
+"""
+import os
+import sys
+import json
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'work_hours'))
+
+import lib.calendar_functions as gcf
+
+N_EVENTS = 100000
+N_COMPANIES = 10
+TIMEZONE = 'Europe/Berlin'
+
+def create_items():
+    """Returns the parsed events.list items, as the API client returns them.
+    """
+    start = 1790000000
+    items = [{
+        'id': f'event{i:020d}',
+        'iCalUID': f'event{i:020d}@google.com',
+        'summary': f'Company {i % N_COMPANIES}',
+        'start': {'dateTime': f'2026-09-{1 + i % 28:02d}T09:00:00+02:00'},
+        'end': {'dateTime': f'2026-09-{1 + i % 28:02d}T11:30:00+02:00'},
+        **({'description': f'Ticket {i}'} if i % 3 == 0 else {}),
+        } for i in range(start, start + N_EVENTS)]
+
+    # Round trip through JSON, so strings are not shared like in real responses
+    return json.loads(json.dumps(items))
+
+def measure(name, create):
+    """Returns the result of create and prints the memory it keeps allocated.
+    """
+    tracemalloc.start()
+    result = create()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{name:>10}: {size / 1024 / 1024:8.1f} MiB, {size / N_EVENTS:7.0f} bytes per event")
+
+    return result
+
+if __name__ == '__main__':
+    print(f"{N_EVENTS} events")
+    items = measure('API dicts', create_items)
+    events = measure('Event', lambda: [gcf.Event.from_api(item, timezone=TIMEZONE) for item in items])
+    del items
+    df = measure('DataFrame', lambda: gcf.create_events_table(events, timezone=TIMEZONE))
+
+    # pandas may keep columns in buffers tracemalloc does not see, e.g. Arrow strings
+    size = df.memory_usage(deep=True).sum()
+    print(f"{'deep':>10}: {size / 1024 / 1024:8.1f} MiB, {size / N_EVENTS:7.0f} bytes per event (DataFrame.memory_usage)")
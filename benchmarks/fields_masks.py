@@ -0,0 +1,140 @@
+"""Compares the payload size and parse time of full API resources with the fields masks.
+
+Runs offline on synthetic resources shaped like the Calendar and Sheets API responses:
+    python benchmarks/fields_masks.py
+"""
+import os
+import sys
+import gzip
+import json
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'work_hours'))
+
+import lib.request_functions as grf
+
+N_EVENTS = 2500 # One full page of events
+N_SHEETS = 2
+REPEAT = 20
+
+def parse_fields(fields):
+    """Parses a fields mask like 'a,b(c,d)' into a nested dict, None for leaf fields.
+    """
+    def parse(pos):
+        tree = {}
+        name = ''
+        while pos < len(fields):
+            char = fields[pos]
+            if char == '(':
+                tree[name.strip()], pos = parse(pos + 1)
+                name = ''
+            elif char == ')':
+                break
+            elif char == ',':
+                if name.strip():
+                    tree[name.strip()] = None
+                name = ''
+            else:
+                name += char
+            pos += 1
+        if name.strip():
+            tree[name.strip()] = None
+        return tree, pos
+
+    return parse(0)[0]
+
+def apply_fields(resource, tree):
+    """Returns the partial response the API sends for a fields mask.
+    """
+    if isinstance(resource, list):
+        return [apply_fields(item, tree) for item in resource]
+
+    return {
+        key: resource[key] if sub_tree is None else apply_fields(resource[key], sub_tree)
+        for key, sub_tree in tree.items() if key in resource
+        }
+
+def create_event(i):
+    """Returns an event with the fields of a typical meeting, see
+    https://developers.google.com/calendar/api/v3/reference/events#resource
+    """
+    person = lambda n: {'id': f'person{n}', 'email': f'person{n}@example.com', 'displayName': f'Person {n}'}
+    return {
+        'kind': 'calendar#event',
+        'etag': f'"3{i:015d}"',
+        'id': f'event{i:020d}',
+        'status': 'confirmed',
+        'htmlLink': f'https://www.google.com/calendar/event?eid=ZXZlbnQ{i:020d}',
+        'created': '2026-09-01T08:00:00.000Z',
+        'updated': '2026-09-02T08:00:00.000Z',
+        'summary': f'Company {i % 5}',
+        'description': 'Project work' if i % 3 else '',
+        'location': 'Office',
+        'creator': {**person(0), 'self': True},
+        'organizer': {**person(0), 'self': True},
+        'start': {'dateTime': '2026-10-19T09:00:00+02:00', 'timeZone': 'Europe/Berlin'},
+        'end': {'dateTime': '2026-10-19T11:00:00+02:00', 'timeZone': 'Europe/Berlin'},
+        'iCalUID': f'event{i:020d}@google.com',
+        'sequence': 0,
+        'attendees': [{**person(n), 'responseStatus': 'accepted'} for n in range(4)],
+        'hangoutLink': 'https://meet.google.com/abc-defg-hij',
+        'conferenceData': {
+            'entryPoints': [
+                {'entryPointType': 'video', 'uri': 'https://meet.google.com/abc-defg-hij', 'label': 'meet.google.com/abc-defg-hij'},
+                {'entryPointType': 'phone', 'uri': 'tel:+49-30-1234567', 'label': '+49 30 1234567', 'pin': '123456789'},
+                ],
+            'conferenceSolution': {'key': {'type': 'hangoutsMeet'}, 'name': 'Google Meet', 'iconUri': 'https://fonts.gstatic.com/s/i/productlogos/meet_2020q4/v6/web-512dp/logo_meet_2020q4_color_2x_web_512dp.png'},
+            'conferenceId': 'abc-defg-hij',
+            },
+        'reminders': {'useDefault': True},
+        'eventType': 'default',
+        }
+
+def create_spreadsheet():
+    """Returns a spreadsheet resource with its sheet properties, see
+    https://developers.google.com/sheets/api/reference/rest/v4/spreadsheets#resource:-spreadsheet
+    """
+    return {
+        'spreadsheetId': 'spreadsheet',
+        'properties': {
+            'title': 'Work Hours', 'locale': 'de_DE', 'autoRecalc': 'ON_CHANGE', 'timeZone': 'Europe/Berlin',
+            'defaultFormat': {
+                'backgroundColor': {'red': 1, 'green': 1, 'blue': 1},
+                'padding': {'top': 2, 'right': 3, 'bottom': 2, 'left': 3},
+                'verticalAlignment': 'BOTTOM', 'wrapStrategy': 'OVERFLOW_CELL',
+                'textFormat': {'foregroundColor': {}, 'fontFamily': 'arial,sans,sans-serif', 'fontSize': 10},
+                },
+            'spreadsheetTheme': {'primaryFontFamily': 'Arial', 'themeColors': [
+                {'colorType': color, 'color': {'rgbColor': {'red': 0.2, 'green': 0.4, 'blue': 0.6}}}
+                for color in ('TEXT', 'BACKGROUND', 'ACCENT1', 'ACCENT2', 'ACCENT3', 'ACCENT4', 'ACCENT5', 'ACCENT6', 'LINK')
+                ]},
+            },
+        'sheets': [{
+            'properties': {
+                'sheetId': n, 'title': f'Sheet{n + 1}', 'index': n, 'sheetType': 'GRID',
+                'gridProperties': {'rowCount': 1000, 'columnCount': 26},
+                },
+            'conditionalFormats': [{'ranges': [{'sheetId': n, 'startRowIndex': 1}], 'booleanRule': {
+                'condition': {'type': 'NUMBER_GREATER', 'values': [{'userEnteredValue': '40'}]},
+                'format': {'backgroundColor': {'red': 1, 'green': 0.8, 'blue': 0.8}}}}],
+            } for n in range(N_SHEETS)],
+        'spreadsheetUrl': 'https://docs.google.com/spreadsheets/d/spreadsheet/edit',
+        }
+
+def measure(name, resource, fields):
+    full = json.dumps(resource)
+    masked = json.dumps(apply_fields(resource, parse_fields(fields)))
+
+    print(f"{name} ({fields})")
+    for label, payload in (('full', full), ('masked', masked)):
+        parse_time = min(timeit.repeat(lambda: json.loads(payload), number=1, repeat=REPEAT))
+        print(f"  {label:>6}: {len(payload) / 1024:9.1f} KiB json, "
+              f"{len(gzip.compress(payload.encode('utf-8'))) / 1024:8.1f} KiB gzip, "
+              f"{parse_time * 1000:8.3f} ms json.loads")
+
+if __name__ == '__main__':
+    measure(f"events.list, {N_EVENTS} events", {
+        'kind': 'calendar#events', 'summary': 'Work', 'timeZone': 'Europe/Berlin',
+        'items': [create_event(i) for i in range(N_EVENTS)],
+        }, grf.EVENT_FIELDS)
+    measure(f"spreadsheets.get, {N_SHEETS} sheets", create_spreadsheet(), grf.SPREADSHEET_FIELDS)
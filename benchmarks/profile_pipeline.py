@@ -0,0 +1,92 @@
+"""Profiles a full run of main.py offline against stubbed Google APIs.
+
+The API services answer with canned responses of googleapiclient's RequestMockBuilder
+and main runs with stub credentials, so neither a token nor network access is needed:
+    python benchmarks/profile_pipeline.py [profile_path]
+
+The profile is written to logs/profile/<date> by default, like with --profile of main.py.
+"""
+import os
+import sys
+import json
+import logging
+import datetime
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'work_hours'))
+
+import main
+import lib.request_functions as grf
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.http import RequestMockBuilder
+
+N_EVENTS = 5000
+N_COMPANIES = 10
+TIMEZONE = 'Europe/Berlin'
+PROFILE_PATH = 'logs/profile'
+
+def create_events():
+    """Returns an events.list response with events spread over the current month.
+    """
+    month = datetime.date.today().replace(day=1)
+    items = []
+    for i in range(N_EVENTS):
+        day = month + datetime.timedelta(days=i % 28)
+        hour = 8 + i % 10
+        items.append({
+            'id': f'event{i:020d}',
+            'iCalUID': f'event{i:020d}@google.com',
+            'summary': f'Company {i % N_COMPANIES}',
+            'start': {'dateTime': f'{day.isoformat()}T{hour:02d}:00:00+02:00'},
+            'end': {'dateTime': f'{day.isoformat()}T{hour + 1:02d}:30:00+02:00'},
+            **({'description': f'Ticket {i}'} if i % 3 == 0 else {}),
+            })
+
+    return {'items': items}
+
+def create_responses():
+    """Returns the canned responses by method ID for all requests of a run.
+    """
+    spreadsheet = {
+        'properties': {'timeZone': TIMEZONE, 'locale': 'de_DE'},
+        'sheets': [
+            {'properties': {'sheetId': 0, 'title': 'Month'}},
+            {'properties': {'sheetId': 1, 'title': 'Week'}}
+            ]
+        }
+    responses = {
+        'calendar.events.list': create_events(),
+        'sheets.spreadsheets.get': spreadsheet,
+        'sheets.spreadsheets.values.batchGet': {'valueRanges': [{}, {}]},
+        'sheets.spreadsheets.batchUpdate': {'spreadsheetId': 'summary'},
+        'drive.files.list': {'files': []},
+        'drive.files.create': {'id': 'file', 'name': 'file'},
+        'drive.files.update': {'id': 'file', 'name': 'file'}
+        }
+
+    return {method_id: (None, json.dumps(response)) for method_id, response in responses.items()}
+
+if __name__ == '__main__':
+    profile_path = os.path.abspath(sys.argv[1] if len(sys.argv) > 1 else PROFILE_PATH)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%d-%m-%y %H:%M:%S'
+    )
+    # Every overlapping event is logged, which would flood the output
+    logging.getLogger('lib.calendar_functions').setLevel(logging.ERROR)
+
+    grf.request_builder = RequestMockBuilder(create_responses())
+    creds = Credentials(token='offline')
+
+    # Exports and checkpoints are written to the working directory
+    with tempfile.TemporaryDirectory() as run_path:
+        with open(f"{run_path}/work_hours.json", 'w', encoding='utf-8') as json_file:
+            json.dump({'summary_id': 'summary', 'weekly_id': 'weekly', 'folder_id': 'folder'}, json_file)
+
+        os.chdir(run_path)
+        main.main(run_path, run_path, False, resume=False, profile_path=profile_path, creds=creds)
+
+    print(f'Profile written to {profile_path}')
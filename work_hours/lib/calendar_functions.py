@@ -1,18 +1,66 @@
 import os
+import sys
 import datetime
 import pytz
 import calendar
 import pandas as pd
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from isoweek import Week
 
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from . import request_functions as grf
 
 LOCAL_TIMEZONE = "Europe/Berlin"
+MAX_WORKERS = 4
+MAX_RESULTS = 2500 # Maximum page size of the Calendar API
+OVERLAP_POLICIES = ('company', 'all', 'none')
 
 logger = logging.getLogger(__name__)
 
+class Event:
+    """Compact record of a calendar event with only the fields used for the work hours.
+    Start and end are stored as epoch seconds, summaries are interned per company.
+    counted_start is where the counted hours start, later than start if overlapping hours are merged.
+    overlap flags events that overlap an earlier event of any company.
+    """
+    __slots__ = ('summary', 'start', 'end', 'description', 'counted_start', 'overlap')
+
+    def __init__(self, summary, start, end, description=None):
+        self.summary = summary
+        self.start = start
+        self.end = end
+        self.description = description
+        self.counted_start = start
+        self.overlap = False
+
+    def __repr__(self):
+        return f"Event({self.summary!r}, {self.start!r}, {self.end!r}, {self.description!r})"
+
+    @classmethod
+    def from_api(cls, event, timezone=LOCAL_TIMEZONE):
+        """Creates an event record from an event resource of the Google Calendar API.
+        """
+        # API reference:
+        # https://developers.google.com/calendar/api/v3/reference/events#resource
+        return cls(
+            sys.intern(event['summary']),
+            convert_api_to_epoch(event['start'], timezone=timezone),
+            convert_api_to_epoch(event['end'], timezone=timezone),
+            event.get('description') or None
+            )
+
+    @property
+    def duration(self):
+        """Counted duration of the event in hours.
+        """
+        return (self.end - self.counted_start) / 60 / 60
+
+    def get_start_date(self, timezone=LOCAL_TIMEZONE):
+        """Returns the start of the event as datetime in the given timezone.
+        """
+        return datetime.datetime.fromtimestamp(self.start, pytz.timezone(timezone))
+
 # The ID of a sample document.
 def get_month_datetimes(date=datetime.datetime.today()):
     """Returns the start and end datetime objects for a given month in a datetime object.
@@ -46,62 +94,160 @@ def convert_datetime_for_api(time:datetime, timezone:str = LOCAL_TIMEZONE):
 
     return utc_date
 
+def convert_api_to_epoch(time:dict, timezone:str = LOCAL_TIMEZONE):
+    """Converts a start or end of the Google Calendar API to epoch seconds.
+    All-day events only have a date, which starts at midnight in the given timezone.
+    """
+    if 'dateTime' in time:
+        date = datetime.datetime.fromisoformat(time['dateTime'].replace('Z', '+00:00'))
+    else:
+        date = pytz.timezone(timezone).localize(datetime.datetime.fromisoformat(time['date']))
+
+    return date.timestamp()
+
 def get_events_by_date(api_service, start_date, end_date, calendar_id, timezone=LOCAL_TIMEZONE):
-    """Gets events from a calendar between two dates.
+    """Gets events from a calendar between two dates as compact event records.
+    The records are keyed by iCalUID and start, to find the same event in other calendars.
     """
     utc_start_date = convert_datetime_for_api(start_date, timezone=timezone)
     utc_end_date = convert_datetime_for_api(end_date, timezone=timezone)
 
     logger.info('Searching for events between %s and %s...', utc_start_date, utc_end_date)
 
-    events_result = api_service.events().list(
-        calendarId=calendar_id,
-        timeMin=utc_start_date,
-        timeMax=utc_end_date,
-        singleEvents=True
-        ).execute()
+    events = {}
+    page_token = None
+    while True:
+        events_result = api_service.events().list(
+            calendarId=calendar_id,
+            timeMin=utc_start_date,
+            timeMax=utc_end_date,
+            singleEvents=True,
+            maxResults=MAX_RESULTS,
+            pageToken=page_token,
+            fields=grf.EVENT_FIELDS
+            ).execute()
+
+        for event in events_result.get('items', []):
+            record = Event.from_api(event, timezone=timezone)
+            # Instances of recurring events share the iCalUID, so the start is part of the key
+            events[(event.get('iCalUID', event.get('id')), record.start)] = record
+
+        # Results are split into pages, follow them until the last one
+        page_token = events_result.get('nextPageToken')
+        if not page_token:
+            break
+
+    logger.info('Found %d events.', len(events))
+
+    return events
+
+def get_events_by_calendar(creds, start_date, end_date, calendar_id, timezone=LOCAL_TIMEZONE):
+    """Gets events from a single calendar with its own API service.
+    """
+    try:
+        # httplib2 is not thread-safe, so every worker needs its own service
+        service = grf.build_service('calendar', 'v3', creds)
 
-    logger.info('Found %d events.', len(events_result.get('items', [])))
+        return get_events_by_date(service, start_date, end_date, calendar_id, timezone=timezone)
 
-    return events_result.get('items', [])
+    except HttpError as error:
+        logger.error('Could not get events from calendar "%s": %s', calendar_id, error)
+        raise
 
-def create_events_table(events):
-    """Creates a pandas DataFrame from a list of events.
+def get_events_by_calendars(creds, start_date, end_date, calendar_ids, timezone=LOCAL_TIMEZONE, max_workers=MAX_WORKERS):
+    """Gets events from several calendars concurrently and merges them.
+    Events found in more than one calendar are only kept once.
+    Raises the HttpError of the first calendar that failed, so no calendar is left out silently.
     """
-    # API reference:
-    # https://developers.google.com/calendar/api/v3/reference/events#resource
+    if isinstance(calendar_ids, str):
+        calendar_ids = [calendar_ids]
 
-    df = pd.DataFrame(columns=['summary', 'start', 'end', 'duration', 'description'])
+    workers = max(1, min(max_workers, len(calendar_ids)))
 
-    for event in events:
-        start = event['start'].get('dateTime', event['start'].get('date'))
-        # tz = pytz.timezone(event['start'].get('timeZone')) # Unused
-        stop = event['end'].get('dateTime', event['end'].get('date'))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            lambda calendar_id: get_events_by_calendar(creds, start_date, end_date, calendar_id, timezone=timezone),
+            calendar_ids
+            )
+
+        # The keys are only needed for merging, the records are returned without them
+        merged = {}
+        for calendar_events in results:
+            for key, event in calendar_events.items():
+                merged.setdefault(key, event)
+        events = list(merged.values())
+
+    logger.info('Found %d unique events in %d calendars.', len(events), len(calendar_ids))
 
-        entry_df = pd.DataFrame({
-            'summary': event['summary'],
-            'start': pd.to_datetime(start),
-            'end': pd.to_datetime(stop),
-            'duration': (pd.to_datetime(stop) - pd.to_datetime(start)).total_seconds() / 60 / 60,
-            'description': event['description'] if 'description' in event else ''
-        }, index=[0], columns=df.columns)
+    return events
 
-        df = pd.concat([df, entry_df], ignore_index=True)
+def create_events_table(events, timezone=LOCAL_TIMEZONE):
+    """Creates a pandas DataFrame from a list of event records, e.g. for exports and logs.
+    Start and end are converted to the given timezone.
+    """
+    df = pd.DataFrame({
+        'summary': [event.summary for event in events],
+        'start': pd.to_datetime([event.start for event in events], unit='s', utc=True).tz_convert(timezone),
+        'end': pd.to_datetime([event.end for event in events], unit='s', utc=True).tz_convert(timezone),
+        'duration': [event.duration for event in events],
+        'description': [event.description or '' for event in events],
+        'overlap': [event.overlap for event in events]
+    }, columns=['summary', 'start', 'end', 'duration', 'description', 'overlap'])
 
     return df
 
-def export_stats_by_company(df, export_path = 'export', german=True):
-    """Creates a pandas DataFrame with the tota''l work hours per company.
+def resolve_overlaps(events, policy='company', timezone=LOCAL_TIMEZONE):
+    """Removes double-counted hours of overlapping event records and flags conflicts.
+    With policy 'company' only events of the same company are merged, with 'all' overlapping
+    time is only counted once across all companies and 'none' keeps the durations unchanged.
+    Merged events start counting where the earlier events end, see Event.counted_start.
+    Events overlapping an earlier event of any company are flagged with Event.overlap,
+    whatever the policy, e.g. the same hour booked for two companies.
+    """
+    if policy not in OVERLAP_POLICIES:
+        raise ValueError(f'policy must be one of {OVERLAP_POLICIES}')
+
+    # Sweep over the events sorted by start, tracking the latest end seen so far
+    # across all events for the conflicts and per merge key for the counted hours
+    covered_all = None
+    covered = {}
+    for event in sorted(events, key=lambda event: (event.start, event.end)):
+        event.counted_start = event.start
+        event.overlap = covered_all is not None and event.start < covered_all
+        covered_all = event.end if covered_all is None else max(covered_all, event.end)
+
+        if policy == 'none':
+            continue
+
+        key = event.summary if policy == 'company' else None
+        covered_end = covered.get(key)
+        if covered_end is None:
+            covered[key] = event.end
+            continue
+        if event.start < covered_end:
+            event.counted_start = min(covered_end, event.end)
+        covered[key] = max(covered_end, event.end)
+
+    overlapping = [event for event in events if event.overlap]
+    if overlapping:
+        logger.warning('Found %d overlapping events: \n %s', len(overlapping),
+                       create_events_table(overlapping, timezone=timezone)[['summary', 'start', 'end', 'duration']].to_string())
+
+    return events
+
+def export_stats_by_company(events, export_path = 'export', german=True, timezone=LOCAL_TIMEZONE):
+    """Exports the event records of every company to its own csv file.
     """
 
-    companies = df['summary'].unique()
+    companies = {}
+    for event in events:
+        companies.setdefault(event.summary, []).append(event)
 
     file_paths = []
 
-    for company in companies:
-        df_company = df.loc[df['summary'] == company]
-        df_company = df_company.reset_index(drop=True)
-        month_string = df_company['start'][0].strftime('%Y-%m')
+    for company, company_events in companies.items():
+        month_string = company_events[0].get_start_date(timezone).strftime('%Y-%m')
+        df_company = create_events_table(company_events, timezone=timezone)
         file_path = export_stats(df_company, f"{export_path}/{company}/{company}_{month_string}.csv", german=german)
         file_paths.append(file_path)
 
@@ -132,36 +278,28 @@ def export_stats(df, file_path = f"export/{datetime.datetime.today().strftime('%
 
     return file_path
 
-def get_event_df_month(creds, month, calendar_id='primary', timezone=LOCAL_TIMEZONE):
-    """Returns a pandas DataFrame with all events from a given month.
+def get_events_month(creds, month, calendar_id='primary', timezone=LOCAL_TIMEZONE, overlap_policy='company'):
+    """Returns the event records of all events from a given month.
+    calendar_id can be a single calendar ID or a list of calendar IDs.
+    Overlapping events are handled according to overlap_policy, see resolve_overlaps.
+    Raises an HttpError if any of the calendars could not be read.
     """
-    try:
-        service = build('calendar', 'v3', credentials=creds, cache_discovery=False)
-
-        start_date, end_date = get_month_datetimes(date=month)
-        events = get_events_by_date(service, start_date, end_date, calendar_id, timezone=timezone)
+    start_date, end_date = get_month_datetimes(date=month)
+    events = get_events_by_calendars(creds, start_date, end_date, calendar_id, timezone=timezone)
 
-        df = create_events_table(events)
-    
-    except HttpError as error:
-        logger.error('Error: %s', error)
-        return None
+    events = resolve_overlaps(events, policy=overlap_policy, timezone=timezone)
 
-    return df
+    return events
 
-def get_event_df_week(creds, date, calendar_id='primary', timezone=LOCAL_TIMEZONE):
-    """Returns a pandas DataFrame with all events from a given month.
+def get_events_week(creds, date, calendar_id='primary', timezone=LOCAL_TIMEZONE, overlap_policy='company'):
+    """Returns the event records of all events from a given week.
+    calendar_id can be a single calendar ID or a list of calendar IDs.
+    Overlapping events are handled according to overlap_policy, see resolve_overlaps.
+    Raises an HttpError if any of the calendars could not be read.
     """
-    try:
-        service = build('calendar', 'v3', credentials=creds, cache_discovery=False)
+    start_date, end_date = get_cw_datetimes(date=date, week=None, year=None)
+    events = get_events_by_calendars(creds, start_date, end_date, calendar_id, timezone=timezone)
 
-        start_date, end_date = get_cw_datetimes(date=date, week=None, year=None)
-        events = get_events_by_date(service, start_date, end_date, calendar_id, timezone=timezone)
-
-        df = create_events_table(events)
-    
-    except HttpError as error:
-        logger.error('Error: %s', error)
-        return None
+    events = resolve_overlaps(events, policy=overlap_policy, timezone=timezone)
 
-    return df
\ No newline at end of file
+    return events
\ No newline at end of file
@@ -0,0 +1,64 @@
+import os
+import json
+import hashlib
+import logging
+
+CHECKPOINT_PATH = 'checkpoints'
+
+logger = logging.getLogger(__name__)
+
+def get_input_hash(*values):
+    """Returns a hash of the pipeline inputs, e.g. the fetched events and the config.
+    """
+    input_hash = hashlib.sha256()
+    for value in values:
+        input_hash.update(value.encode('utf-8'))
+
+    return input_hash.hexdigest()[:16]
+
+def load_checkpoint(period, input_hash, checkpoint_path=CHECKPOINT_PATH):
+    """Returns the finished steps of a previous run for the same period and inputs.
+    """
+    file_path = f"{checkpoint_path}/{period}.json"
+
+    if not os.path.exists(file_path):
+        return []
+
+    try:
+        with open(file_path, encoding='utf-8') as json_file:
+            checkpoint = json.load(json_file)
+    except (OSError, ValueError) as error:
+        logger.warning('Could not read checkpoint "%s": %s', file_path, error)
+        return []
+
+    if checkpoint.get('input_hash') != input_hash:
+        logger.info('Inputs for %s have changed, starting from the first step.', period)
+        return []
+
+    steps = checkpoint.get('steps', [])
+    logger.info('Resuming %s, finished steps: %s', period, steps)
+
+    return steps
+
+def save_checkpoint(steps, period, input_hash, checkpoint_path=CHECKPOINT_PATH):
+    """Saves the finished steps of the current run for its period and inputs.
+    """
+    os.makedirs(checkpoint_path, exist_ok=True)
+    file_path = f"{checkpoint_path}/{period}.json"
+
+    # Write to a temporary file first, so a crash never leaves a broken checkpoint
+    with open(f"{file_path}.tmp", 'w', encoding='utf-8') as json_file:
+        json.dump({'input_hash': input_hash, 'steps': steps}, json_file, indent=4)
+    os.replace(f"{file_path}.tmp", file_path)
+
+    return file_path
+
+def clear_checkpoint(period, checkpoint_path=CHECKPOINT_PATH):
+    """Removes the checkpoint of a period once all its steps have finished,
+    so the next run starts from the first step again.
+    """
+    file_path = f"{checkpoint_path}/{period}.json"
+
+    if os.path.exists(file_path):
+        os.remove(file_path)
+        logger.info('All steps for %s have finished, checkpoint has been removed.', period)
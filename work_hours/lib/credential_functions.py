@@ -0,0 +1,157 @@
+import os
+import datetime
+import threading
+import logging
+from contextlib import contextmanager
+
+from google.auth.exceptions import GoogleAuthError
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+
+try:
+    import fcntl
+except ImportError: # Windows, token file is not locked
+    fcntl = None
+
+# Refresh the access token this long before it expires
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+logger = logging.getLogger(__name__)
+
+def utcnow():
+    """Returns the current UTC time as naive datetime, like the expiry of the credentials.
+    """
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+def expires_soon(creds, margin=REFRESH_MARGIN):
+    """Checks if credentials have no access token or it expires within the margin.
+    """
+    if not creds.token:
+        return True
+    if creds.expiry is None:
+        return False
+
+    return creds.expiry - margin <= utcnow()
+
+@contextmanager
+def lock_file(file_path):
+    """Locks a file exclusively between processes while the context is active.
+    """
+    with open(f"{file_path}.lock", 'w', encoding='utf-8') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+class CredentialManager:
+    """Shares one set of credentials between all API services, threads and processes.
+    The token file is locked while it is read for a refresh or written, and the access
+    token is refreshed in the background before it expires. If another process already
+    refreshed the token, its token is used instead of refreshing again.
+    """
+
+    def __init__(self, token_path, scopes, margin=REFRESH_MARGIN):
+        self.token_path = token_path
+        self.scopes = scopes
+        self.margin = margin
+        self.creds = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def load_credentials(self):
+        """Loads the credentials from the token file, None if there is none.
+        """
+        if not os.path.exists(self.token_path):
+            return None
+
+        return Credentials.from_authorized_user_file(self.token_path, self.scopes)
+
+    def save_credentials(self, creds):
+        """Saves credentials to the token file, replacing it at once.
+        """
+        with open(f"{self.token_path}.tmp", 'w', encoding='utf-8') as token:
+            token.write(creds.to_json())
+        os.replace(f"{self.token_path}.tmp", self.token_path)
+
+    def set_credentials(self, creds):
+        """Uses new credentials, e.g. from the authorization flow, and saves them for the next runs.
+        """
+        with self._lock, lock_file(self.token_path):
+            self.creds = creds
+            self.save_credentials(creds)
+
+        return self.creds
+
+    def get_credentials(self):
+        """Returns the shared credentials, refreshed if they expire soon.
+        If the refresh fails, a token that is still valid is used until it expires.
+        None or invalid credentials mean the user has to authorize again.
+        """
+        if self.creds is None:
+            with lock_file(self.token_path):
+                self.creds = self.load_credentials()
+
+        if self.creds and expires_soon(self.creds, self.margin):
+            self.refresh()
+
+        return self.creds
+
+    def refresh(self):
+        """Refreshes the access token once for all processes sharing the token file.
+        Returns False if it could not be refreshed, e.g. without network, to retry later.
+        """
+        if not self.creds or not self.creds.refresh_token:
+            return False
+
+        with self._lock, lock_file(self.token_path):
+            # Another process may have refreshed the token while waiting for the lock
+            cached = self.load_credentials()
+            if cached and cached.refresh_token == self.creds.refresh_token and not expires_soon(cached, self.margin):
+                # Update in place, so all services using the credentials get the new token
+                self.creds.token = cached.token
+                self.creds.expiry = cached.expiry
+                logger.info('Using token refreshed by another process, valid until %s.', self.creds.expiry)
+                return True
+
+            try:
+                self.creds.refresh(Request())
+            except GoogleAuthError as error: # Includes revoked tokens and network errors
+                logger.error('Could not refresh token: %s', error)
+                return False
+
+            self.save_credentials(self.creds)
+            logger.info('Token has been refreshed, valid until %s.', self.creds.expiry)
+
+        return True
+
+    def start(self):
+        """Starts refreshing the credentials in the background before they expire.
+        """
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='token-refresh', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops the background refresh.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _seconds_until_refresh(self):
+        if self.creds is None or self.creds.expiry is None:
+            return None
+
+        return max(0.0, (self.creds.expiry - self.margin - utcnow()).total_seconds())
+
+    def _run(self):
+        while not self._stop.wait(timeout=self._seconds_until_refresh()):
+            if not self.refresh():
+                # Retry later instead of spinning on a failing refresh
+                self._stop.wait(timeout=self.margin.total_seconds() / 5)
@@ -1,9 +1,9 @@
 import os
 import logging
 
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload
+from . import request_functions as grf
 
 logger = logging.getLogger(__name__)
 
@@ -16,15 +16,16 @@ def check_if_file_exists(creds, file_name, folder_id):
 
     try:
         # create drive api client
-        service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+        service = grf.build_service('drive', 'v3', creds)
 
         # Check if a file with the same name already exists in the folder
         query = f"'{folder_id}' in parents and trashed = false and name='{file_name}'"
         
         # pylint: disable=maybe-no-member
-        files = service.files().list(q=query, fields='nextPageToken, '
-                                                    'files(id, name)').execute()
+        files = service.files().list(q=query, fields=grf.FILE_LIST_FIELDS).execute()
         existing_files = files.get('files', [])
+        if files.get('nextPageToken'):
+            logger.warning('Not all results for "%s" fit on one page, only the first page is used.', file_name)
        
         if existing_files:
             # A file with the same name already exists, so return the existing file
@@ -46,14 +47,14 @@ def replace_sheet_content(file_id, creds, file_path):
 
     try:
         # create drive api client
-        service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+        service = grf.build_service('drive', 'v3', creds)
 
         # create media body
         media = MediaFileUpload(file_path, mimetype='text/csv',
                                 resumable=True)
 
         # pylint: disable=maybe-no-member
-        request = service.files().update(fileId=file_id, media_body=media)
+        request = service.files().update(fileId=file_id, media_body=media, fields=grf.FILE_FIELDS)
         response = request.execute()
 
         logger.info('File "%s" with ID: "%s" has been updated.', response.get("name"), response.get("id"))
@@ -76,7 +77,7 @@ def create_sheet_csv(creds, file_path, folder_id):
 
     try:
         # create drive api client
-        service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+        service = grf.build_service('drive', 'v3', creds)
 
         # create file metadata
         file_metadata = {
@@ -89,7 +90,7 @@ def create_sheet_csv(creds, file_path, folder_id):
                                 resumable=True)
 
         # pylint: disable=maybe-no-member
-        request = service.files().create(body=file_metadata, media_body=media, fields='id, name')
+        request = service.files().create(body=file_metadata, media_body=media, fields=grf.FILE_FIELDS)
         response = request.execute()
 
         logger.info('File "%s" with ID: "%s" has been created.', response.get("name"), response.get("id"))
@@ -122,7 +123,7 @@ def upload_csv_with_conversion(file_path, creds, folder_id):
         logger.error('An error occurred: %s', error)
         response = None
 
-    return response.get('id')
+    return response.get('id') if response else None
 
 def create_folder(creds, folder_name, parent_folder_id):
     """Create a folder in Google Drive.
@@ -133,15 +134,16 @@ def create_folder(creds, folder_name, parent_folder_id):
 
     try:
         # create drive api client
-        service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+        service = grf.build_service('drive', 'v3', creds)
 
         # Check if a folder with the same name already exists in the parent folder
         query = f"'{parent_folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed = false and name='{folder_name}'"
         
         # pylint: disable=maybe-no-member
-        files = service.files().list(q=query, fields='nextPageToken, '
-                                                    'files(id, name)').execute()
+        files = service.files().list(q=query, fields=grf.FILE_LIST_FIELDS).execute()
         existing_folders = files.get('files', [])
+        if files.get('nextPageToken'):
+            logger.warning('Not all results for "%s" fit on one page, only the first page is used.', folder_name)
        
         if existing_folders:
             # A folder with the same name already exists, so return the existing folder
@@ -156,7 +158,7 @@ def create_folder(creds, folder_name, parent_folder_id):
 
             # Create the folder
             # pylint: disable=maybe-no-member
-            file_response = service.files().create(body=file_metadata, fields='id,name').execute()
+            file_response = service.files().create(body=file_metadata, fields=grf.FILE_FIELDS).execute()
             logger.info('Folder has been created with Name "%s" and URL: "https://drive.google.com/drive/folders/%s".', folder_name, file_response.get("id"))
 
         return file_response
@@ -167,19 +169,38 @@ def create_folder(creds, folder_name, parent_folder_id):
     
     return file_response
 
-def upload_csv_folder_with_conversion(export_path, creds, folder_id):
+def upload_csv_folder_with_conversion(export_path, creds, folder_id, skip=(), on_upload=None):
     """Upload a csv file to Google Drive and convert it to a Google Sheet.
+    Files in skip are not uploaded again and on_upload is called with every uploaded file.
+    Returns the paths of the files that could not be uploaded.
     """
 
     # API reference: 
     # https://developers.google.com/drive/api/guides/manage-uploads
 
+    failed = []
     for directory in os.listdir(export_path): # Get all the directories in the current working directory
         directory_path = os.path.join(export_path, directory)
         if os.path.isdir(directory_path): # Check if the directory is a folder
-            g_folder = create_folder(creds, directory, folder_id) # Create a folder in Google Drive
+            file_paths = []
             for file in os.listdir(directory_path): # Get all the files in the folder
                 file_path = os.path.join(directory_path, file) # Get the file path
-                if os.path.isfile(file_path): # Check if the file is a file
-                    if file.endswith('.csv'): # Check if the file is a csv file
-                        upload_csv_with_conversion(file_path, creds, g_folder['id']) # Upload the csv file to Google Drive
\ No newline at end of file
+                if os.path.isfile(file_path) and file.endswith('.csv'): # Check if the file is a csv file
+                    if file_path in skip: # Check if the file was uploaded in a previous run
+                        logger.info('File "%s" has already been uploaded.', file_path)
+                    else:
+                        file_paths.append(file_path)
+            if not file_paths:
+                continue
+            g_folder = create_folder(creds, directory, folder_id) # Create a folder in Google Drive
+            if not g_folder:
+                failed += file_paths
+                continue
+            for file_path in file_paths:
+                file_id = upload_csv_with_conversion(file_path, creds, g_folder['id']) # Upload the csv file to Google Drive
+                if not file_id:
+                    failed.append(file_path)
+                elif on_upload:
+                    on_upload(file_path)
+
+    return failed
\ No newline at end of file
@@ -0,0 +1,149 @@
+import os
+import io
+import sys
+import time
+import pstats
+import cProfile
+import datetime
+import threading
+import tracemalloc
+import logging
+from collections import Counter
+from contextlib import contextmanager
+
+TOP_N = 20
+SAMPLE_INTERVAL = 0.005
+
+logger = logging.getLogger(__name__)
+
+class StackSampler:
+    """Samples the stacks of all threads in the background.
+    The samples are written as folded stacks, which can be rendered by flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items(): # pylint: disable=protected-access
+                if thread_id == own_id:
+                    continue
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def write_folded(self, file_path):
+        with open(file_path, 'w', encoding='utf-8') as folded:
+            for stack, count in self.stacks.items():
+                folded.write(f"{stack} {count}\n")
+
+        return file_path
+
+class Profiler:
+    """Profiles the stages of a run with cProfile, a stack sampler and tracemalloc.
+    For every stage a .prof file (pstats) and a .folded file (flamegraph) are written to the
+    profile directory, and the top hotspots and allocations of all stages to summary.txt.
+    Without a profile path all stages run unprofiled.
+    """
+
+    def __init__(self, profile_path=None, top_n=TOP_N, interval=SAMPLE_INTERVAL):
+        self.enabled = profile_path is not None
+        self.top_n = top_n
+        self.interval = interval
+        self.summary = []
+
+        if self.enabled:
+            self.profile_path = f"{profile_path}/{datetime.datetime.today().strftime('%Y-%m-%d_%H-%M-%S')}"
+            os.makedirs(self.profile_path, exist_ok=True)
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        """Profiles the code run inside the context as a stage of the run.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        snapshot_start = tracemalloc.take_snapshot()
+        sampler = StackSampler(interval=self.interval)
+        profile = cProfile.Profile()
+
+        start = time.perf_counter()
+        sampler.start()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            sampler.stop()
+            duration = time.perf_counter() - start
+
+            snapshot_end = tracemalloc.take_snapshot()
+            self.write_stage(name, duration, profile, sampler, snapshot_start, snapshot_end)
+
+    def write_stage(self, name, duration, profile, sampler, snapshot_start, snapshot_end):
+        profile.dump_stats(f"{self.profile_path}/{name}.prof")
+        sampler.write_folded(f"{self.profile_path}/{name}.folded")
+
+        # Top functions by cumulative time
+        stream = io.StringIO()
+        pstats.Stats(profile, stream=stream).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top_n)
+
+        # Top allocations since the start of the stage
+        allocations = snapshot_end.compare_to(snapshot_start, 'lineno')[:self.top_n]
+        current, peak = tracemalloc.get_traced_memory()
+
+        self.summary.append('\n'.join([
+            f"===== Stage: {name} =====",
+            f"Duration: {duration:.3f} s",
+            f"Traced memory: {current / 1024 / 1024:.1f} MiB (peak {peak / 1024 / 1024:.1f} MiB)",
+            '',
+            f"Top {self.top_n} functions by cumulative time:",
+            stream.getvalue().strip(),
+            '',
+            f"Top {self.top_n} allocations:",
+            *[str(allocation) for allocation in allocations],
+            '',
+            ]))
+
+        logger.info('Stage "%s" took %.3f s.', name, duration)
+
+    def write_summary(self):
+        """Writes the hotspot summary of all profiled stages, returns its path.
+        """
+        if not self.enabled:
+            return None
+
+        file_path = f"{self.profile_path}/summary.txt"
+        with open(file_path, 'w', encoding='utf-8') as summary:
+            summary.write('\n'.join(self.summary))
+
+        tracemalloc.stop()
+        logger.info('Profile has been written to "%s".', self.profile_path)
+
+        return file_path
@@ -0,0 +1,22 @@
+from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest
+
+# Builds the requests of all API services, a googleapiclient.http.RequestMockBuilder
+# answers them with canned responses instead, e.g. for offline profiling.
+request_builder = HttpRequest
+
+# Partial responses, only the fields used by the lib modules are requested.
+# Compression needs no setup, googleapiclient already accepts gzip on every request.
+# https://developers.google.com/calendar/api/guides/performance#partial-response
+EVENT_FIELDS = 'nextPageToken,items(id,iCalUID,summary,start,end,description)'
+SPREADSHEET_FIELDS = 'properties(timeZone,locale),sheets(properties(sheetId,title))'
+SHEETS_FIELDS = 'sheets(properties(sheetId,title))'
+BATCH_GET_FIELDS = 'valueRanges(values)'
+BATCH_UPDATE_FIELDS = 'spreadsheetId'
+FILE_FIELDS = 'id, name'
+FILE_LIST_FIELDS = 'nextPageToken, files(id, name)'
+
+def build_service(service_name, version, creds):
+    """Builds an API service with the request builder of this module.
+    """
+    return build(service_name, version, credentials=creds, requestBuilder=request_builder, cache_discovery=False)
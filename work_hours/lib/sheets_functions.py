@@ -1,191 +1,120 @@
 import pandas as pd
 import logging
 
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from . import request_functions as grf
+from .calendar_functions import LOCAL_TIMEZONE
 
 logger = logging.getLogger(__name__)
 
-def read_header(creds, spreadsheet_id, sheet_idx=0):
-    # https://developers.google.com/sheets/api/reference/rest/v4/spreadsheets.values/append
+def read_properties(creds, spreadsheet_id):
+    """Returns the timezone, locale and sheet properties of a spreadsheet.
+    The sheet properties can be passed on to append_statistics to save reading them again.
+    """
+    # https://developers.google.com/sheets/api/reference/rest/v4/spreadsheets/get
     try:
-        # create drive api client
-        service = build('sheets', 'v4', credentials=creds, cache_discovery=False)
+        # create sheets api client
+        service = grf.build_service('sheets', 'v4', creds)
 
         # pylint: disable=maybe-no-member
-        sheet = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
-        
-        sheet_0 = sheet['sheets'][sheet_idx]['properties']
-        sheet_title = sheet_0['title']
-        sheet_id = sheet_0['sheetId']
-        tz = sheet['properties']['timeZone']
-        locale = sheet['properties']['locale']
-
-        header_row = service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_id,
-            range=f"{sheet_title}!A1:Z1"
-            ).execute()
-
-        if 'values' in header_row:
-            header = header_row['values'][0]
-        else:
-            header = None
-        
-        logger.info('Got header from Sheet ID: "%s".', spreadsheet_id)
-
-    except HttpError as error:
-        logger.error('An error occurred: %s', error)
-        header, tz, locale, sheet_title = None, None, None, None
+        spreadsheet = service.spreadsheets().get(spreadsheetId=spreadsheet_id, fields=grf.SPREADSHEET_FIELDS).execute()
 
-    return header, tz, locale, sheet_title, sheet_id
+        tz = spreadsheet['properties']['timeZone']
+        locale = spreadsheet['properties']['locale']
+        sheets = [sheet['properties'] for sheet in spreadsheet['sheets']]
 
-def append_rows(creds, value_list, spreadsheet_id, sheet='Sheet1'):
-    # https://developers.google.com/sheets/api/reference/rest/v4/spreadsheets.values/append
-    try:
-        # create drive api client
-        service = build('sheets', 'v4', credentials=creds, cache_discovery=False)
-
-        range_ = sheet
-        value_input_option = 'USER_ENTERED'
-        insert_data_option = 'INSERT_ROWS'
-        value_range_body = {
-            'values': value_list
-        }
-
-        # pylint: disable=maybe-no-member
-        request = service.spreadsheets().values().append(
-            spreadsheetId=spreadsheet_id,
-            range=range_,
-            valueInputOption=value_input_option,
-            insertDataOption=insert_data_option,
-            body=value_range_body
-            )
-        
-        response = request.execute()
-
-        logger.info('Sheet with ID: "%s" has been updated.', spreadsheet_id)
+        logger.info('Got properties from Sheet ID: "%s".', spreadsheet_id)
 
     except HttpError as error:
         logger.error('An error occurred: %s', error)
-        response = None
+        tz, locale, sheets = None, None, None
 
-    return response
+    return tz, locale, sheets
 
-def update_spreadsheet(cred, spreadsheet_id, data, sheet='Sheet1', sheet_id=0):
-    try:
-        # Create a service client and build the Sheets API service
-        service = build('sheets', 'v4', credentials=cred)
+def read_sheets(service, spreadsheet_id, sheet_idxs, sheets=None):
+    """Reads the properties and values of several sheets of a spreadsheet.
+    The properties are only requested if sheets from read_properties are not given.
+    All values are read with a single values.batchGet.
+    """
+    # https://developers.google.com/sheets/api/reference/rest/v4/spreadsheets.values/batchGet
 
-        # Get the data from the sheet
+    if sheets is None:
         # pylint: disable=maybe-no-member
-        result = service.spreadsheets().values().get(spreadsheetId=spreadsheet_id, range=f'{sheet}!A:Z').execute()
-        values = result.get('values', [])
-
-        # String values to float for comparison
-        values_num = [[float(v.replace(',','.')) if v != '' else 0 for v in val] for val in values[1:]]
-        data_num = [[float(v) for v in val] for val in data]
-
-        # Create a dictionary of rows to update and rows to append
-        rows_to_update = {}
-        rows_to_append = []
-        for row in data_num:
-            found = False
-            for i, r in enumerate(values_num):
-                if len(r) == 0: # Skip empty rows in sheet
-                    continue
-                if r[0] == row[0] and r[1] == row[1]:
-                    rows_to_update[i+1] = row
-                    found = True
-                    # break # Stop if the first match is found
-            if not found:
-                rows_to_append.append(row)
-
-        # Update the rows in the sheet
-        requests = []
-        for i, row in rows_to_update.items():
-            requests.append({
-                'updateCells': {
-                    'start': {
-                        'sheetId': sheet_id,
-                        'rowIndex': i,
-                        'columnIndex': 0
-                    },
-                'rows': [{
-                    'values': [{'userEnteredValue': {'numberValue': cell}} for cell in row]
-                }],
-                'fields': 'userEnteredValue',
-                }
-            })
-        if requests:
-            # pylint: disable=maybe-no-member
-            response = service.spreadsheets().batchUpdate(spreadsheetId=spreadsheet_id, body={'requests': requests}).execute()
-
-        # Append the rows to the sheet
-        if rows_to_append:
-            # pylint: disable=maybe-no-member
-            response = service.spreadsheets().values().append(
-                spreadsheetId=spreadsheet_id, range=f'{sheet}!A:Z',
-                insertDataOption='INSERT_ROWS', valueInputOption='USER_ENTERED',
-                body={'values': rows_to_append}).execute()
-
-        logger.info('Spreadsheet with ID "%s"  and sheet %d has been updated.', spreadsheet_id, sheet_id)
-        logger.info('Updated rows: %s', rows_to_update)
-        logger.info('Appended rows: %s', rows_to_append)
-
-    except HttpError as error:
-        logger.error('An error occurred while updating the spreadsheet: %s', error)
-        response = None
-
-
-def update_rows(creds, value_list, spreadsheet_id, sheet='Sheet1', start_row=1):
-    # https://developers.google.com/sheets/api/reference/rest/v4/spreadsheets.values/append
-    try:
-        # create drive api client
-        service = build('sheets', 'v4', credentials=creds, cache_discovery=False)
-
-        range_ = f"{sheet}!A{start_row}:Z{start_row + len(value_list) - 1}"
-        value_input_option = 'USER_ENTERED'
-        value_range_body = {
-            'values': [value_list]
+        spreadsheet = service.spreadsheets().get(spreadsheetId=spreadsheet_id, fields=grf.SHEETS_FIELDS).execute()
+        sheets = [sheet['properties'] for sheet in spreadsheet['sheets']]
+    sheets = [sheets[sheet_idx] for sheet_idx in sheet_idxs]
+
+    # pylint: disable=maybe-no-member
+    result = service.spreadsheets().values().batchGet(
+        spreadsheetId=spreadsheet_id,
+        ranges=[f"{sheet['title']}!A:Z" for sheet in sheets],
+        fields=grf.BATCH_GET_FIELDS
+        ).execute()
+    values = [value_range.get('values', []) for value_range in result.get('valueRanges', [])]
+
+    return sheets, values
+
+def get_row_data(row):
+    """Returns the row data of a list of values for updateCells and appendCells requests.
+    """
+    return {
+        'values': [
+            {'userEnteredValue': {'stringValue': cell} if isinstance(cell, str) else {'numberValue': cell}}
+            for cell in row
+            ]
         }
 
-        # pylint: disable=maybe-no-member
-        request = service.spreadsheets().values().update(
-            spreadsheetId=spreadsheet_id,
-            range=range_,
-            valueInputOption=value_input_option,
-            body=value_range_body
-            )
-        
-        response = request.execute()
-
-        logger.info('Sheet with ID: "%s" has been updated.', spreadsheet_id)
-
-    except HttpError as error:
-        logger.error('An error occurred: %s', error)
-        response = None
+def update_cells_request(rows, sheet_id=0, row_idx=0):
+    return {
+        'updateCells': {
+            'start': {
+                'sheetId': sheet_id,
+                'rowIndex': row_idx,
+                'columnIndex': 0
+            },
+            'rows': [get_row_data(row) for row in rows],
+            'fields': 'userEnteredValue',
+        }
+    }
+
+def append_cells_request(rows, sheet_id=0):
+    return {
+        'appendCells': {
+            'sheetId': sheet_id,
+            'rows': [get_row_data(row) for row in rows],
+            'fields': 'userEnteredValue',
+        }
+    }
 
-    return response
+def pivot_hours(hours, time_type='month'):
+    """Returns a pandas DataFrame of hours summed by (year, month or week, company),
+    with a row per year and month or week and a column per company.
+    """
+    if not hours:
+        return pd.DataFrame(index=pd.MultiIndex.from_tuples([], names=['year', time_type]))
 
-def get_statistics_by_company(df):
-    df['year'] = df['start'].apply(lambda x: x.strftime('%Y'))
-    df['month'] = df['start'].apply(lambda x: x.strftime('%m'))
-    
-    df = df.groupby(['year', 'month', 'summary'])['duration'].sum()
-    df = pd.DataFrame(df).reset_index().pivot(index=['year', 'month'], columns='summary', values='duration').fillna(0)
-    # df.index = df.index.astype(str)
+    df = pd.Series(list(hours.values()), index=pd.MultiIndex.from_tuples(list(hours), names=['year', time_type, 'summary']))
+    df = df.unstack('summary').sort_index().fillna(0)
 
     return df
 
-def get_statistics_by_company_weekly(df):
-    df['year'] = df['start'].apply(lambda x: pd.to_datetime(x).isocalendar()[0])
-    df['week'] = df['start'].apply(lambda x: pd.to_datetime(x).isocalendar()[1])
+def get_statistics_by_company(events, timezone=LOCAL_TIMEZONE):
+    hours = {}
+    for event in events:
+        start = event.get_start_date(timezone)
+        key = (start.strftime('%Y'), start.strftime('%m'), event.summary)
+        hours[key] = hours.get(key, 0) + event.duration
 
-    df = df.groupby(['year', 'week', 'summary'])['duration'].sum()
-    df = pd.DataFrame(df).reset_index().pivot(index=['year', 'week'], columns='summary', values='duration').fillna(0)
-    # df.index = df.index.astype(str)
+    return pivot_hours(hours, time_type='month')
 
-    return df
+def get_statistics_by_company_weekly(events, timezone=LOCAL_TIMEZONE):
+    hours = {}
+    for event in events:
+        year, week, _ = event.get_start_date(timezone).isocalendar()
+        key = (year, week, event.summary)
+        hours[key] = hours.get(key, 0) + event.duration
+
+    return pivot_hours(hours, time_type='week')
 
 def sync_header(df, orig_header):
     # Check if there are new columns
@@ -213,43 +142,109 @@ def sync_header(df, orig_header):
 
     return df_update
 
-def update_sheet(creds, df, spreadsheet_id, time_type='Month'):
-    if time_type == 'Month':
-        sheet_id = 0
-    elif time_type == 'Week':
-        sheet_id = 1
-    else:
-        raise ValueError('time_type must be Month or Week')
-    
-    orig_header, _, _, sheet_title, sheet_id = read_header(creds, spreadsheet_id, sheet_idx=sheet_id)
-
-    if orig_header is None:
+def plan_sheet_update(df, values, sheet_id=0, time_type='Month'):
+    """Returns the batchUpdate requests for writing the sums of a DataFrame to a sheet with the given values.
+    """
+    if not values:
         header = df.columns.tolist()
         header.insert(0, time_type)
         header.insert(0, 'Year')
 
-        append_rows(creds, [header], spreadsheet_id, sheet=sheet_title)
-
         df_update = sync_header(df, header)
-        response = append_rows(creds, df_update.values.tolist(), spreadsheet_id, sheet=sheet_title)
-    else:
-        df_update = sync_header(df, orig_header)
+        data_num = [[float(v) for v in val] for val in df_update.values.tolist()]
+
+        logger.info('Appended header and rows: %s', data_num)
+
+        return [append_cells_request([header] + data_num, sheet_id=sheet_id)]
+
+    requests = []
+    orig_header = values[0]
+    df_update = sync_header(df, orig_header)
+
+    if len(df_update.columns) != len(orig_header):
+        logger.warning('Columns are not the same. Header: %s, Columns: %s', orig_header, df_update.columns.tolist())
+        requests.append(update_cells_request([df_update.columns.tolist()], sheet_id=sheet_id, row_idx=0))
+
+    # String values to float for comparison
+    values_num = [[float(v.replace(',','.')) if v != '' else 0 for v in val] for val in values[1:]]
+    data_num = [[float(v) for v in val] for val in df_update.values.tolist()]
+
+    # Create a dictionary of rows to update and rows to append
+    rows_to_update = {}
+    rows_to_append = []
+    for row in data_num:
+        found = False
+        for i, r in enumerate(values_num):
+            if len(r) == 0: # Skip empty rows in sheet
+                continue
+            if r[0] == row[0] and r[1] == row[1]:
+                rows_to_update[i+1] = row
+                found = True
+                # break # Stop if the first match is found
+        if not found:
+            rows_to_append.append(row)
+
+    for i, row in rows_to_update.items():
+        requests.append(update_cells_request([row], sheet_id=sheet_id, row_idx=i))
+
+    if rows_to_append:
+        requests.append(append_cells_request(rows_to_append, sheet_id=sheet_id))
+
+    logger.info('Updated rows: %s', rows_to_update)
+    logger.info('Appended rows: %s', rows_to_append)
+
+    return requests
+
+def append_statistics(creds, updates, timezone=LOCAL_TIMEZONE, sheets=None):
+    """Writes the monthly or weekly sums of event records to their Google Sheets.
+    updates is a list of (events, spreadsheet_id, time_type) tuples. All changes to one spreadsheet
+    are sent in a single batchUpdate. Returns the responses by spreadsheet ID, None if it failed.
+    sheets maps spreadsheet IDs to sheet properties already read with read_properties.
+    """
+    # https://developers.google.com/sheets/api/reference/rest/v4/spreadsheets/batchUpdate
+    plans = {}
+    for events, spreadsheet_id, time_type in updates:
+        if time_type == 'Month':
+            sheet_idx = 0
+            df = get_statistics_by_company(events, timezone=timezone)
+        elif time_type == 'Week':
+            sheet_idx = 1
+            df = get_statistics_by_company_weekly(events, timezone=timezone)
+        else:
+            raise ValueError('time_type must be Month or Week')
+
+        logger.info('Summary of work hours for %s: \n %s', time_type.lower(), df.to_string())
+
+        plans.setdefault(spreadsheet_id, []).append((df, sheet_idx, time_type))
+
+    responses = {}
+    for spreadsheet_id, plan in plans.items():
+        try:
+            service = grf.build_service('sheets', 'v4', creds)
+
+            plan_sheets, values = read_sheets(
+                service, spreadsheet_id, [sheet_idx for _, sheet_idx, _ in plan],
+                sheets=(sheets or {}).get(spreadsheet_id))
 
-        if len(df_update.columns) != len(orig_header):
-            logger.warning('Columns are not the same. Header: %s, Columns: %s', orig_header, df_update.columns.tolist())
-            logger.info('Updating header from Sheet ID: "%s".', spreadsheet_id)
-            update_rows(creds, df_update.columns.tolist(), spreadsheet_id, sheet=sheet_title)
+            requests = []
+            for (df, _, time_type), sheet, sheet_values in zip(plan, plan_sheets, values):
+                requests += plan_sheet_update(df, sheet_values, sheet_id=sheet['sheetId'], time_type=time_type)
 
-        update_spreadsheet(creds, spreadsheet_id, df_update.values.tolist(), sheet=sheet_title, sheet_id=sheet_id)
-        # response = append_rows(creds, df_update.values.tolist(), spreadsheet_id, sheet=sheet_title)
+            response = {}
+            if requests:
+                # pylint: disable=maybe-no-member
+                response = service.spreadsheets().batchUpdate(
+                    spreadsheetId=spreadsheet_id,
+                    body={'requests': requests},
+                    fields=grf.BATCH_UPDATE_FIELDS
+                    ).execute()
 
+            logger.info('Spreadsheet with ID "%s" has been updated with %d requests.', spreadsheet_id, len(requests))
 
-def append_statistics(creds, df, spreadsheet_id, time_type='Month'):
-    if time_type == 'Month':
-        df = get_statistics_by_company(df)
-    else:
-        df = get_statistics_by_company_weekly(df)
+        except HttpError as error:
+            logger.error('An error occurred while updating the spreadsheet: %s', error)
+            response = None
 
-    logger.info('Summary of work hours for %s: \n %s', time_type.lower(), df.to_string())
+        responses[spreadsheet_id] = response
 
-    update_sheet(creds, df, spreadsheet_id, time_type=time_type)
\ No newline at end of file
+    return responses
@@ -9,9 +9,10 @@ import json
 import lib.calendar_functions as gcf
 import lib.drive_functions as gdf
 import lib.sheets_functions as gsf
+import lib.checkpoint_functions as gchf
+import lib.credential_functions as gcrf
+import lib.profile_functions as gprf
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.errors import HttpError
 from oauth2client.service_account import ServiceAccountCredentials
@@ -62,6 +63,22 @@ parser.add_argument(
     action=argparse.BooleanOptionalAction,
     help='Use console for authorization (default: False)')
 
+parser.add_argument(
+    '--resume',
+    type=bool,
+    dest='resume',
+    default=True,
+    action=argparse.BooleanOptionalAction,
+    help='Skip steps finished by a previous run with the same inputs (default: True)')
+
+parser.add_argument(
+    '--profile',
+    type=bool,
+    dest='profile',
+    default=False,
+    action=argparse.BooleanOptionalAction,
+    help='Profile every stage and write the results to <log>/profile (default: False)')
+
 # If modifying these scopes, delete the file token.json.
 # https://developers.google.com/identity/protocols/oauth2/scopes#drive
 SCOPES = [
@@ -78,23 +95,16 @@ def create_service_credentials(user_email):
 
     return credentials
 
-def create_token_local(creds, cred_path):
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                f"{cred_path}/credentials.json", SCOPES)
-            creds = flow.run_local_server(
-                host='localhost',
-                port=8088,
-                authorization_prompt_message='Please visit this URL for authorizing: {url}',
-                success_message='The auth flow is complete; you may close this window.',
-                open_browser=True
-                )
-        # Save the credentials for the next run
-        with open(f"{cred_path}/token.json", 'w', encoding='utf-8') as token:
-            token.write(creds.to_json())
+def create_token_local(cred_path):
+    flow = InstalledAppFlow.from_client_secrets_file(
+        f"{cred_path}/credentials.json", SCOPES)
+    creds = flow.run_local_server(
+        host='localhost',
+        port=8088,
+        authorization_prompt_message='Please visit this URL for authorizing: {url}',
+        success_message='The auth flow is complete; you may close this window.',
+        open_browser=True
+        )
 
     return creds
 
@@ -108,93 +118,140 @@ def credentials_to_dict(credentials):
             'scopes': credentials.scopes,
             'id_token': credentials.id_token}
 
-def create_token_server(creds, cred_path):
-    if creds and creds.expired and creds.refresh_token:
-        creds.refresh(Request())
-    else:
-        flow = InstalledAppFlow.from_client_secrets_file(
-            f"{cred_path}/credentials.json",
-            scopes=SCOPES
-            )
-
-        flow.redirect_uri = "http://localhost"
-        auth_url, __ = flow.authorization_url(prompt="consent")
-        logger.info('Please go to this URL for authorization: %s', auth_url)
-        code = input('Enter the authorization code from the browser URL: ')
-        flow.fetch_token(code=code)
+def create_token_server(cred_path):
+    flow = InstalledAppFlow.from_client_secrets_file(
+        f"{cred_path}/credentials.json",
+        scopes=SCOPES
+        )
 
-        creds = flow.credentials
+    flow.redirect_uri = "http://localhost"
+    auth_url, __ = flow.authorization_url(prompt="consent")
+    logger.info('Please go to this URL for authorization: %s', auth_url)
+    code = input('Enter the authorization code from the browser URL: ')
+    flow.fetch_token(code=code)
 
-    # Save the credentials for the next run
-    with open(f"{cred_path}/token.json", 'w', encoding='utf-8') as token:
-        token.write(creds.to_json())
+    creds = flow.credentials
 
     return creds
 
-def main(cred_path, config_path, server_mode, month_past=0, week_past=0):
+def main(cred_path, config_path, server_mode, month_past=0, week_past=0, resume=True, profile_path=None, creds=None):
     """Shows basic usage of the Google Calendar API.
     Prints the start and name of the next 10 events on the user's calendar.
     """
-    creds = None
-    # The file token.json stores the user's access and refresh tokens, and is
-    # created automatically when the authorization flow completes for the first
-    # time.
-    if os.path.exists(f"{cred_path}/token.json"):
-        creds = Credentials.from_authorized_user_file(f"{cred_path}/token.json", SCOPES)
-    
-    # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if server_mode:
-            creds = create_token_server(creds, cred_path)
-        else:
-            creds = create_token_local(creds, cred_path)
+    with open(f"{config_path}/work_hours.json", encoding='utf-8') as json_file:
+        ids = json.load(json_file)
+
+    # Single calendar ID or list of calendar IDs
+    calendar_ids = ids.get('calendar_ids', ids.get('calendar_id', 'primary'))
+
+    # Merge overlapping events per company, across all companies or not at all
+    overlap_policy = ids.get('overlap_policy', 'company')
+    if overlap_policy not in gcf.OVERLAP_POLICIES:
+        logger.error('overlap_policy must be one of %s, got "%s".', gcf.OVERLAP_POLICIES, overlap_policy)
+        return
+
+    # Given credentials are used as they are, e.g. stub credentials for offline runs
+    credential_manager = None
+    if creds is None:
+        # The file token.json stores the user's access and refresh tokens, and is
+        # created automatically when the authorization flow completes for the first
+        # time. It is shared by all runs and refreshed before the token expires.
+        credential_manager = gcrf.CredentialManager(f"{cred_path}/token.json", SCOPES)
+        creds = credential_manager.get_credentials()
+
+        # If there are no (valid) credentials available, let the user log in.
+        if not creds or not creds.valid:
+            if server_mode:
+                creds = create_token_server(cred_path)
+            else:
+                creds = create_token_local(cred_path)
+            creds = credential_manager.set_credentials(creds)
+
+        credential_manager.start()
+
+    # Stages are only profiled with a profile path
+    profiler = gprf.Profiler(profile_path)
     
     try:
-        with open(f"{config_path}/work_hours.json", encoding='utf-8') as json_file:
-            ids = json.load(json_file)
+        # Get timezone, locale and sheets from Google Sheet
+        with profiler.stage('properties'):
+            tz, locale, summary_sheets = gsf.read_properties(creds, spreadsheet_id=ids['summary_id'])
+
 
-        # Get timezone and locale from Google Sheet
-        _, tz, locale, _, sheet_id = gsf.read_header(creds, spreadsheet_id=ids['summary_id'])
-        
         # Get month
         today = datetime.datetime.today()
         # first = today.replace(day=1)
         used_month = today + relativedelta(months=-month_past)
         used_week = today + relativedelta(weeks=-week_past)
 
-        # Get events from calendar
-        df_week = gcf.get_event_df_week(creds, used_week, calendar_id=ids["calendar_id"], timezone=tz)
-
-        logger.info('Events found week: \n %s', df_week.to_string())
-
-        # Get events from calendar
-        df_month = gcf.get_event_df_month(creds, used_month, calendar_id=ids["calendar_id"], timezone=tz)
-
-        logger.info('Events found month: \n %s', df_month.to_string())
-
-        # Delete old csv files
-        if os.path.exists(EXPORT_PATH) and os.path.isdir(EXPORT_PATH):
-            shutil.rmtree(EXPORT_PATH)
-
-        # Export to csv
-        german = locale == 'de_DE'
-        file_path = gcf.export_stats(df_month, file_path=f"{EXPORT_PATH}/all_{used_month.strftime('%Y-%m')}.csv", german=german)
-
-        # Export to csv by company
-        file_paths = gcf.export_stats_by_company(df_month, export_path=EXPORT_PATH, german=german)
-
-        # Upload all csv files to Google Drive
-        gdf.upload_csv_folder_with_conversion(EXPORT_PATH, creds, folder_id=ids["folder_id"])
-
-        # Append monthly sum to Google Sheet
-        gsf.append_statistics(creds, df_month, spreadsheet_id=ids['summary_id'], time_type='Month')
-
-        # Append weekly sum to Google Sheet
-        gsf.append_statistics(creds, df_week, spreadsheet_id=ids['weekly_id'], time_type='Week')
+        with profiler.stage('fetch'):
+            # Get events from calendar
+            events_week = gcf.get_events_week(creds, used_week, calendar_id=calendar_ids, timezone=tz, overlap_policy=overlap_policy)
+
+            logger.info('Events found week: %d', len(events_week))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Events found week: \n %s', gcf.create_events_table(events_week, timezone=tz).to_string())
+
+            # Get events from calendar
+            events_month = gcf.get_events_month(creds, used_month, calendar_id=calendar_ids, timezone=tz, overlap_policy=overlap_policy)
+
+            logger.info('Events found month: %d', len(events_month))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Events found month: \n %s', gcf.create_events_table(events_month, timezone=tz).to_string())
+
+        # Load the steps finished by a previous run with the same period and inputs
+        period = f"{used_month.strftime('%Y-%m')}_{used_week.strftime('%G-W%V')}"
+        input_hash = gchf.get_input_hash(repr(events_month), repr(events_week), json.dumps(ids, sort_keys=True))
+        steps = gchf.load_checkpoint(period, input_hash) if resume else []
+
+        def finish_step(step):
+            steps.append(step)
+            gchf.save_checkpoint(steps, period, input_hash)
+
+        with profiler.stage('export'):
+            # Delete old csv files
+            if os.path.exists(EXPORT_PATH) and os.path.isdir(EXPORT_PATH):
+                shutil.rmtree(EXPORT_PATH)
+
+            # Export to csv
+            german = locale == 'de_DE'
+            file_path = gcf.export_stats(gcf.create_events_table(events_month, timezone=tz), file_path=f"{EXPORT_PATH}/all_{used_month.strftime('%Y-%m')}.csv", german=german)
+
+            # Export to csv by company
+            file_paths = gcf.export_stats_by_company(events_month, export_path=EXPORT_PATH, german=german, timezone=tz)
+
+        with profiler.stage('upload'):
+            # Upload all csv files to Google Drive
+            failed_uploads = gdf.upload_csv_folder_with_conversion(
+                EXPORT_PATH, creds, folder_id=ids["folder_id"],
+                skip=steps, on_upload=finish_step)
+
+        with profiler.stage('sheets'):
+            # Append monthly and weekly sums to Google Sheets, with one batch update per spreadsheet
+            statistics = {'summary_id': (events_month, 'Month'), 'weekly_id': (events_week, 'Week')}
+            updates = {key: (events, ids[key], time_type) for key, (events, time_type) in statistics.items() if key not in steps}
+            if len(updates) < len(statistics):
+                logger.info('Already appended: %s', [key for key in statistics if key not in updates])
+
+            responses = gsf.append_statistics(
+                creds, list(updates.values()), timezone=tz,
+                sheets={ids['summary_id']: summary_sheets})
+            for key, (_, spreadsheet_id, _) in updates.items():
+                if responses.get(spreadsheet_id) is not None:
+                    finish_step(key)
+
+        # Only a failed run is resumed, a finished run is done again by the next run
+        if not failed_uploads and all(key in steps for key in statistics):
+            gchf.clear_checkpoint(period)
 
     except HttpError as error:
         logger.info('An error occurred: %s', error)
 
+    finally:
+        if credential_manager:
+            credential_manager.stop()
+        profiler.write_summary()
+
 
 if __name__ == '__main__':
     args = parser.parse_args()
@@ -205,6 +262,8 @@ if __name__ == '__main__':
     past_month = args.past_month
     past_week = args.past_week
     server_mode = args.server_mode
+    resume = args.resume
+    profile_path = f"{log_path}/profile" if args.profile else None
 
     os.makedirs(log_path, exist_ok=True)
     logging.basicConfig(
@@ -217,4 +276,4 @@ if __name__ == '__main__':
         ]
     )
 
-    main(cred_path, config_path, server_mode, month_past=past_month, week_past=past_week)
+    main(cred_path, config_path, server_mode, month_past=past_month, week_past=past_week, resume=resume, profile_path=profile_path)